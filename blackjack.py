@@ -1,5 +1,6 @@
 import os
 import random
+import struct
 
 class PlayingCard:
     """Instantiates a card complete with it's rank and suit.
@@ -10,6 +11,9 @@ class PlayingCard:
     rank_list = ["2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K", "A"]
     # list of possible card suits
     suit_list = ["♠", "♥", "♦", "♣"]
+    # lookups from rank and suit to their part of a card code
+    rank_index = {rank: i for i, rank in enumerate(rank_list)}
+    suit_offset = {suit: i * 13 for i, suit in enumerate(suit_list)}
     
     def __init__(self, rank: str="", suit: str="", value: int=0):
         """Initialize class variables.
@@ -36,11 +40,59 @@ class PlayingCard:
         else:
             return "{} of {}".format(self.rank, self.suit)
 
+    def to_code(self) -> int:
+        """Encode the card as a single byte for snapshots.
+
+        The low 6 bits hold suit_index * 13 + rank_index (0-51) and bit 6 is
+        set when an ace is currently being counted as 1.
+
+        Returns:
+            Integer card code between 0 and 127.
+            
+        Raises:
+            ValueError: If the card has an invalid rank or suit.
+        """
+        try:
+            code = self.suit_offset[self.suit] + self.rank_index[self.rank]
+        except KeyError:
+            raise ValueError("Cannot encode {}".format(self))
+        # remember aces that have been lowered to 1 by evaluate_aces
+        if self.rank == "A" and self.value == 1:
+            code |= 64
+        return code
+
+    @classmethod
+    def from_code(cls, code: int):
+        """Rebuild a card from a code produced by to_code().
+
+        Args:
+            code: integer card code
+
+        Raises:
+            ValueError: If the code does not describe a card.
+        """
+        index = code & 63
+        if not 0 <= code <= 127 or index > 51:
+            raise ValueError("Invalid card code: {}".format(code))
+        rank = cls.rank_list[index % 13]
+        suit = cls.suit_list[index // 13]
+        # only aces can be flagged as low
+        if code & 64 and rank != "A":
+            raise ValueError("Invalid card code: {}".format(code))
+        # aces flagged as low keep their value of 1
+        value = 1 if code & 64 else Deck.value[rank]
+        return cls(rank, suit, value)
+
 class Deck:
     """Instantiates a Deck object complete with at least 52 standard cards in 
     a deck of cards.
     - shuffle_deck() method to randomize position of cards for dealing.
     - deal_card() method to remove a card from the deck.
+    - set_cards() method to replace the cards left in the deck.
+    
+    Each deck shuffles with its own generator seeded from the seed and the
+    number of shuffles so far, so a snapshot only needs those two numbers
+    to reproduce every later shuffle of this deck.
     """
     # list of possible card ranks
     rank_list = ["2", "3", "4", "5", "6", "7", "8", "9", "10", 
@@ -51,8 +103,21 @@ class Deck:
     value = {"2":2, "3":3, "4":4, "5":5, "6":6, "7":7, "8":8, "9":9, "10":10, 
              "J":10, "Q":10, "K":10, "A":11}
     
-    def __init__(self):
-        """Initialize class variables."""
+    def __init__(self, seed: int=None):
+        """Initialize class variables.
+        
+        Args:
+            seed: 64-bit seed for shuffling, drawn from the random module if
+                not given
+                
+        Raises:
+            ValueError: If the seed does not fit in 64 bits.
+        """
+        if seed is not None and not 0 <= seed < 2 ** 64:
+            raise ValueError("The seed must be between 0 and 2**64 - 1!")
+        # seed and number of shuffles done, together they fix the next shuffle
+        self.seed = random.getrandbits(64) if seed is None else seed
+        self.shuffles = 0
         # start with no cards
         self.cards = []
         # specify number of decks to use
@@ -65,10 +130,26 @@ class Deck:
                     val = self.value[y]
                     self.cards.append(PlayingCard(y, x, val))
             self.num_decks -= 1
+        
+        # side bet odds follow the composition of the remaining cards
+        self.odds = SideBets(self.cards, len(self.cards) // 52)
+
+    def set_cards(self, cards: list):
+        """Replace the cards left in the deck and rebuild the side bet odds.
+        
+        Args:
+            cards: list of PlayingCard objects in dealing order
+            
+        Raises:
+            ValueError: If a card appears more often than the shoe allows.
+        """
+        self.odds = SideBets(cards, self.odds.num_decks)
+        self.cards = cards
 
     def shuffle_deck(self):
         """Randomly shuffle the cards in a deck."""
-        random.shuffle(self.cards)
+        random.Random((self.seed << 32) | self.shuffles).shuffle(self.cards)
+        self.shuffles += 1
     
     def deal_card(self):
         """This method will deal cards until there are no cards left.
@@ -79,6 +160,8 @@ class Deck:
         # try to deal a card from the deck
         try:
             if self.cards:        
+                # update the odds first so a failure leaves the shoe untouched
+                self.odds.remove_card(self.cards[0])
                 return self.cards.pop(0)
         # raise error if there are no cards left
         except AttributeError:
@@ -338,11 +421,277 @@ class Counter:
         amount_to_bet = (self.current_count - 1) * self.betting_unit
         
         return amount_to_bet
+
+class SideBets:
+    """Instantiates an exact odds calculator for insurance, Perfect Pairs and
+    21+3 based on the cards remaining in the shoe.
+    - remove_card() method to update the composition when a card is dealt.
+    - insurance(), perfect_pairs() and twenty_one_plus_three() methods to
+      quote probabilities and expected value per unit bet.
+    
+    Every combination count is kept as a sum of per rank, per suit and per
+    straight terms, so dealing a card only recomputes the few terms that
+    contain it instead of enumerating the whole shoe again.
+    """
+    # payouts for each winning Perfect Pairs outcome
+    perfect_pairs_pays = {"Perfect Pair": 25, "Colored Pair": 12, "Mixed Pair": 6}
+    # payouts for each winning 21+3 outcome
+    twenty_one_plus_three_pays = {"Suited Trips": 100, "Straight Flush": 40,
+                                  "Three of a Kind": 30, "Straight": 10, "Flush": 5}
+    # insurance pays 2 to 1 when the dealer has blackjack
+    insurance_pays = 2
+    # rank indexes of the ten valued cards
+    ten_ranks = [8, 9, 10, 11]
+    # rank indexes of every 3 card straight, the ace plays low and high
+    straights = [(12, 0, 1)] + [(x, x + 1, x + 2) for x in range(11)]
+    # indexes into straights of the straights that contain each rank
+    rank_straights = [[0, 1], [0, 1, 2], [1, 2, 3], [2, 3, 4], [3, 4, 5],
+                      [4, 5, 6], [5, 6, 7], [6, 7, 8], [7, 8, 9], [8, 9, 10],
+                      [9, 10, 11], [10, 11], [0, 11]]
+    
+    def __init__(self, cards: list, num_decks: int=5):
+        """Initialize class variables.
+        
+        Args:
+            cards: list of PlayingCard objects left in the shoe
+            num_decks: number of decks in a full shoe, which limits the copies
+                of each card
+        """
+        self.num_decks = num_decks
+        self.reset(cards)
+    
+    def reset(self, cards: list):
+        """Rebuild every count from a list of cards.
+        
+        Args:
+            cards: list of PlayingCard objects left in the shoe
+            
+        Raises:
+            ValueError: If a card appears more often than the shoe allows.
+        """
+        # number of cards left of each card code (suit * 13 + rank)
+        counts = [0] * 52
+        for card in cards:
+            code = card.to_code() & 63
+            counts[code] += 1
+            if counts[code] > self.num_decks:
+                raise ValueError("Too many copies of {} for the shoe!".format(card))
+        self.counts = counts
+        self.total = len(cards)
+        # number of cards left of each rank and of each suit
+        self.rank_totals = [sum(self.counts[r::13]) for r in range(13)]
+        self.suit_totals = [sum(self.counts[s * 13:s * 13 + 13]) for s in range(4)]
+        
+        # per rank terms: ordered pairs and unordered three of a kinds
+        self.perfect = [0] * 13
+        self.colored = [0] * 13
+        self.mixed = [0] * 13
+        self.suited_trips = [0] * 13
+        self.trips = [0] * 13
+        # per suit terms: unordered 3 card hands of one suit
+        self.suited = [0] * 4
+        # per straight terms: unordered straight flushes and plain straights
+        self.straight_flush = [0] * len(self.straights)
+        self.straight = [0] * len(self.straights)
+        
+        for r in range(13):
+            self.update_rank(r)
+        for s in range(4):
+            self.update_suit(s)
+        for k in range(len(self.straights)):
+            self.update_straight(k)
+        
+        self.totals = {"perfect": sum(self.perfect), "colored": sum(self.colored),
+                       "mixed": sum(self.mixed), "suited_trips": sum(self.suited_trips),
+                       "trips": sum(self.trips), "suited": sum(self.suited),
+                       "straight_flush": sum(self.straight_flush),
+                       "straight": sum(self.straight)}
+        self.cache = {}
+    
+    @staticmethod
+    def choose_3(n: int) -> int:
+        """Number of ways to choose 3 cards from n cards."""
+        return n * (n - 1) * (n - 2) // 6
+    
+    def update_rank(self, r: int):
+        """Recompute the pair and three of a kind terms of one rank."""
+        # suits are ordered ♠, ♥, ♦, ♣ so ♠/♣ are black and ♥/♦ are red
+        spade, heart, diamond, club = (self.counts[s * 13 + r] for s in range(4))
+        self.perfect[r] = sum(n * (n - 1) for n in (spade, heart, diamond, club))
+        self.colored[r] = 2 * (spade * club + heart * diamond)
+        self.mixed[r] = 2 * (spade + club) * (heart + diamond)
+        self.suited_trips[r] = sum(self.choose_3(n) for n in (spade, heart, diamond, club))
+        self.trips[r] = self.choose_3(self.rank_totals[r]) - self.suited_trips[r]
+    
+    def update_suit(self, s: int):
+        """Recompute the same suit term of one suit."""
+        self.suited[s] = self.choose_3(self.suit_totals[s])
+    
+    def update_straight(self, k: int):
+        """Recompute the straight flush and straight terms of one straight."""
+        a, b, c = self.straights[k]
+        counts = self.counts
+        flush = sum(counts[s * 13 + a] * counts[s * 13 + b] * counts[s * 13 + c]
+                    for s in range(4))
+        rank_totals = self.rank_totals
+        self.straight_flush[k] = flush
+        self.straight[k] = rank_totals[a] * rank_totals[b] * rank_totals[c] - flush
+    
+    def remove_card(self, card):
+        """Update the composition after a card leaves the shoe.
+        
+        Args:
+            card: PlayingCard object that was dealt
+            
+        Raises:
+            ValueError: If the card is not left in the shoe.
+        """
+        code = card.to_code() & 63
+        if self.counts[code] == 0:
+            raise ValueError("{} is not left in the shoe!".format(card))
+        self.update_card(code, -1)
+    
+    def add_card(self, card):
+        """Update the composition after a card returns to the shoe.
+        
+        Args:
+            card: PlayingCard object put back into the shoe
+            
+        Raises:
+            ValueError: If every copy of the card is already in the shoe.
+        """
+        code = card.to_code() & 63
+        if self.counts[code] == self.num_decks:
+            raise ValueError("Every {} is already in the shoe!".format(card))
+        self.update_card(code, 1)
+    
+    def update_card(self, code: int, delta: int):
+        """Change the count of one card code and refresh the terms it is in.
+        
+        Args:
+            code: card code without the low ace flag
+            delta: change in the number of copies left in the shoe
+        """
+        r, s = code % 13, code // 13
+        
+        # subtract the old terms that contain the card
+        totals = self.totals
+        totals["perfect"] -= self.perfect[r]
+        totals["colored"] -= self.colored[r]
+        totals["mixed"] -= self.mixed[r]
+        totals["suited_trips"] -= self.suited_trips[r]
+        totals["trips"] -= self.trips[r]
+        totals["suited"] -= self.suited[s]
+        for k in self.rank_straights[r]:
+            totals["straight_flush"] -= self.straight_flush[k]
+            totals["straight"] -= self.straight[k]
+        
+        self.counts[code] += delta
+        self.rank_totals[r] += delta
+        self.suit_totals[s] += delta
+        self.total += delta
+        
+        # add back the recomputed terms
+        self.update_rank(r)
+        self.update_suit(s)
+        totals["perfect"] += self.perfect[r]
+        totals["colored"] += self.colored[r]
+        totals["mixed"] += self.mixed[r]
+        totals["suited_trips"] += self.suited_trips[r]
+        totals["trips"] += self.trips[r]
+        totals["suited"] += self.suited[s]
+        for k in self.rank_straights[r]:
+            self.update_straight(k)
+            totals["straight_flush"] += self.straight_flush[k]
+            totals["straight"] += self.straight[k]
+        
+        self.cache = {}
+    
+    def expected_value(self, probabilities: dict, pays: dict) -> float:
+        """Expected value per unit bet of a side bet.
+        
+        Args:
+            probabilities: probability of each winning outcome
+            pays: payout of each winning outcome
+        """
+        win = sum(probabilities[outcome] for outcome in pays)
+        return sum(probabilities[outcome] * pays[outcome] for outcome in pays) - (1 - win)
+    
+    def insurance(self, unseen: list=None) -> dict:
+        """Quote insurance when the dealer shows an ace.
+        
+        Args:
+            unseen: dealt cards the player cannot see, like the dealer's hole
+                card, which are still possible outcomes
+        
+        Returns:
+            Probability that the dealer has blackjack and the expected value
+            of insurance per unit bet.
+        """
+        unseen = unseen or []
+        total = self.total + len(unseen)
+        tens = sum(self.rank_totals[r] for r in self.ten_ranks)
+        tens += sum(1 for card in unseen if PlayingCard.rank_index[card.rank] in self.ten_ranks)
+        if total == 0:
+            return {"Dealer Blackjack": 0.0, "EV": -1.0}
+        p = tens / total
+        return {"Dealer Blackjack": p, "EV": p * self.insurance_pays - (1 - p)}
+    
+    def perfect_pairs(self) -> dict:
+        """Quote Perfect Pairs on the player's first 2 cards.
+        
+        Returns:
+            Probability of each winning outcome and the expected value per
+            unit bet.
+        """
+        if "perfect_pairs" not in self.cache:
+            pairs = self.total * (self.total - 1)
+            totals = self.totals
+            quote = {"Perfect Pair": totals["perfect"] / pairs if pairs else 0.0,
+                     "Colored Pair": totals["colored"] / pairs if pairs else 0.0,
+                     "Mixed Pair": totals["mixed"] / pairs if pairs else 0.0}
+            quote["EV"] = self.expected_value(quote, self.perfect_pairs_pays)
+            self.cache["perfect_pairs"] = quote
+        return self.cache["perfect_pairs"]
+    
+    def twenty_one_plus_three(self) -> dict:
+        """Quote 21+3 on the player's first 2 cards and the dealer's up card.
+        
+        Returns:
+            Probability of each winning outcome and the expected value per
+            unit bet.
+        """
+        if "twenty_one_plus_three" not in self.cache:
+            hands = self.choose_3(self.total)
+            totals = self.totals
+            # same suit hands that are neither straight flushes nor suited trips
+            flush = totals["suited"] - totals["straight_flush"] - totals["suited_trips"]
+            counts = {"Suited Trips": totals["suited_trips"],
+                      "Straight Flush": totals["straight_flush"],
+                      "Three of a Kind": totals["trips"],
+                      "Straight": totals["straight"], "Flush": flush}
+            quote = {outcome: count / hands if hands else 0.0
+                     for outcome, count in counts.items()}
+            quote["EV"] = self.expected_value(quote, self.twenty_one_plus_three_pays)
+            self.cache["twenty_one_plus_three"] = quote
+        return self.cache["twenty_one_plus_three"]
     
 # GAME LOGIC STARTS
 
 class Game:
-    """Instantiates the core Blackjack game object."""
+    """Instantiates the core Blackjack game object.
+    - save_snapshot() method to pack the game state into compact bytes.
+    - load_snapshot() method to resume a game from those bytes.
+    """
+    # snapshot format identifier and version
+    snapshot_magic = b"BJSS"
+    snapshot_version = 1
+    # magic, version, count, betting unit, round, player action, split flag,
+    # number of player hands, deck seed and number of shuffles
+    snapshot_header = struct.Struct("<4sBiiIBBBQI")
+    # type flag (0 for int, 1 for float) followed by the 8 byte value
+    snapshot_int = struct.Struct("<Bq")
+    snapshot_float = struct.Struct("<Bd")
     
     def __init__(self):
         """Initialize class with attributes."""
@@ -383,6 +732,139 @@ class Game:
     
     def player_dealer_draw(self):
         self.funds += self.bet
+
+    def pack_cards(self, cards) -> bytes:
+        """Pack a list of cards as a length prefix followed by card codes."""
+        return struct.pack("<H", len(cards)) + bytes(card.to_code() for card in cards)
+
+    def unpack_cards(self, data, offset):
+        """Unpack a list of cards written by pack_cards().
+
+        Returns:
+            The list of cards and the offset just past them.
+        """
+        (length,) = struct.unpack_from("<H", data, offset)
+        offset += 2
+        codes = data[offset:offset + length]
+        if len(codes) != length:
+            raise ValueError("Truncated snapshot!")
+        return [PlayingCard.from_code(code) for code in codes], offset + length
+
+    def pack_number(self, number) -> bytes:
+        """Pack an int or float so that it unpacks with the same type."""
+        if isinstance(number, float):
+            return self.snapshot_float.pack(1, number)
+        return self.snapshot_int.pack(0, number)
+
+    def unpack_number(self, data, offset):
+        """Unpack a number written by pack_number().
+
+        Returns:
+            The number and the offset just past it.
+        """
+        (flag,) = struct.unpack_from("<B", data, offset)
+        if flag == 0:
+            (number,) = self.snapshot_int.unpack_from(data, offset)[1:]
+        elif flag == 1:
+            (number,) = self.snapshot_float.unpack_from(data, offset)[1:]
+        else:
+            raise ValueError("Invalid number type in snapshot!")
+        return number, offset + self.snapshot_int.size
+
+    def save_snapshot(self) -> bytes:
+        """Save funds, bet, count, shoe order, hands and the deck's shuffle
+        seed.
+
+        The remaining shoe is stored in dealing order, so the next card dealt
+        after load_snapshot() is the same one that would have been dealt here,
+        and later shuffles repeat because the deck's seed and shuffle count
+        are saved too.
+
+        Returns:
+            Snapshot of the game as bytes.
+        """
+        parts = [self.snapshot_header.pack(self.snapshot_magic, self.snapshot_version,
+                                           self.count, self.betting_unit,
+                                           self.game_round, self.player_action,
+                                           self.split_flag, len(self.player_hands),
+                                           self.deck.seed, self.deck.shuffles)]
+        parts.append(self.pack_number(self.funds))
+        parts.append(self.pack_number(self.bet))
+        # the remaining shoe, dealer, split cards and every player hand
+        parts.append(self.pack_cards(self.deck.cards))
+        parts.append(self.pack_cards(self.dealer.cards))
+        parts.append(self.pack_cards(self.split_store))
+        for hand in self.player_hands:
+            parts.append(self.pack_cards(hand.cards))
+        return b"".join(parts)
+
+    def load_snapshot(self, data: bytes):
+        """Resume the game from bytes produced by save_snapshot().
+
+        Nothing is changed unless the whole snapshot is valid.
+
+        Args:
+            data: snapshot bytes
+
+        Raises:
+            ValueError: If the data is not a valid snapshot.
+        """
+        data = bytes(data)
+        try:
+            (magic, version, count, betting_unit, game_round, player_action,
+             split_flag, num_hands, seed, shuffles) = self.snapshot_header.unpack_from(data, 0)
+            if magic != self.snapshot_magic or version != self.snapshot_version:
+                raise ValueError("Unsupported snapshot format!")
+            if player_action not in (0, 1) or split_flag not in (0, 1):
+                raise ValueError("Invalid game flags in snapshot!")
+            # a split round plays exactly 2 hands, otherwise there is at most 1
+            if (split_flag == 1 and num_hands != 2) or (split_flag == 0 and num_hands > 1):
+                raise ValueError("Number of hands does not match the split flag!")
+            offset = self.snapshot_header.size
+            funds, offset = self.unpack_number(data, offset)
+            bet, offset = self.unpack_number(data, offset)
+            
+            deck_cards, offset = self.unpack_cards(data, offset)
+            dealer_cards, offset = self.unpack_cards(data, offset)
+            split_store, offset = self.unpack_cards(data, offset)
+            player_hands = []
+            for _ in range(num_hands):
+                hand = Hand()
+                hand.cards, offset = self.unpack_cards(data, offset)
+                hand.update_score()
+                player_hands.append(hand)
+            
+            if offset != len(data):
+                raise ValueError("Unexpected data after snapshot!")
+            
+            # split cards are only stored while a split is being played
+            if len(split_store) != 2 * split_flag:
+                raise ValueError("Split cards do not match the split flag!")
+            # no card can appear more often than the decks in the shoe allow
+            copies = [0] * 52
+            for cards in [deck_cards, dealer_cards, split_store] + [hand.cards for hand in player_hands]:
+                for card in cards:
+                    copies[card.to_code() & 63] += 1
+            if max(copies) > self.deck.odds.num_decks:
+                raise ValueError("Too many copies of a card in snapshot!")
+        except struct.error:
+            raise ValueError("Truncated snapshot!")
+        
+        # only overwrite the game once the whole snapshot has been read
+        self.deck.set_cards(deck_cards)
+        self.funds = funds
+        self.bet = bet
+        self.count = count
+        self.betting_unit = betting_unit
+        self.game_round = game_round
+        self.player_action = player_action
+        self.split_flag = split_flag
+        self.deck.seed = seed
+        self.deck.shuffles = shuffles
+        self.dealer.cards = dealer_cards
+        self.dealer.update_score()
+        self.split_store = split_store
+        self.player_hands = player_hands
         
     def clear(self):
         """Clears the playing board"""
@@ -431,15 +913,21 @@ class Game:
                 
         return template_list
         
-    def board(self, strategy):
+    def board(self, strategy, insurance=0):
         """prints out board
-        hand is a Hand instance from self.player_hands list"""
+        hand is a Hand instance from self.player_hands list
+        insurance is 1 to quote insurance if the dealer shows an ace"""
         
         print("Dealer's cards:")
         
         if self.player_action == 0:
             self.template_print(self.add_template_list(self.dealer.cards, 1))
             print("Dealer's score:", self.dealer.score - self.dealer.cards[0].value)
+            # the hole card is still unseen when quoting insurance
+            if insurance == 1 and self.dealer.cards[1].rank == "A":
+                insurance = self.deck.odds.insurance([self.dealer.cards[0]])
+                print(f"Insurance: dealer blackjack {insurance['Dealer Blackjack']:.2%}, "
+                      f"EV {insurance['EV']:+.4f} per unit")
         else:
             self.template_print(self.add_template_list(self.dealer.cards, 0))
             print("Dealer's score:", self.dealer.score)
@@ -485,6 +973,9 @@ class Game:
                     hand.cards.append(self.split_store[1])
                 # draw one card in addition to the split card
                 hand.draw_card(self.deck)
+            
+            # insurance is only on offer before the player's first move of a round
+            offer_insurance = 1 if self.split_flag == 0 else 0
                 
             while self.action != "q":
                 # keeps asking the player for actions until player chooses
@@ -494,7 +985,7 @@ class Game:
                 self.clear()
                 
                 strategy = Strategy(self.dealer.cards[1], [x.rank for x in hand.cards], [x.value for x in hand.cards])
-                self.board(strategy.basic_strategy())
+                self.board(strategy.basic_strategy(), offer_insurance)
                 
                 # for testing
                 #print([x.rank for x in hand.cards])
@@ -523,6 +1014,7 @@ class Game:
                     else:
                         print("Please enter a valid action!")
                     continue
+                offer_insurance = 0
                 
                 # logic for the action the player chooses
                 if self.action == 'h':
@@ -626,6 +1118,11 @@ class Game:
                 else:
                     print("Strategy: You should bet the minimum: 50")
                 
+                perfect_pairs = self.deck.odds.perfect_pairs()
+                twenty_one_plus_three = self.deck.odds.twenty_one_plus_three()
+                print(f"Perfect Pairs EV: {perfect_pairs['EV']:+.4f} per unit")
+                print(f"21+3 EV: {twenty_one_plus_three['EV']:+.4f} per unit")
+                
                 try:
                     bet_amount = abs(int(input("\nHow much would you like to bet?: ")))
                     
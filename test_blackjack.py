@@ -0,0 +1,249 @@
+import itertools
+import random
+from unittest import mock
+
+import pytest
+
+# blackjack.py asks for a menu choice in the body of class Engine as soon as it
+# is imported, so answer that prompt with "" to skip straight past the game
+with mock.patch("builtins.input", return_value=""):
+    import blackjack
+
+
+def make_deck(ranks, suit="♠"):
+    """Build a deck holding only the given ranks, dealt in that order."""
+    deck = blackjack.Deck(seed=1)
+    deck.set_cards([blackjack.PlayingCard(rank, suit, blackjack.Deck.value[rank])
+                    for rank in ranks])
+    return deck
+
+
+def mid_shoe_game():
+    """A game part way through a shoe with a low ace and float funds."""
+    game = blackjack.Game()
+    game.deck.shuffle_deck()
+    for _ in range(3):
+        game.dealer.draw_card(game.deck)
+    # take an A♠ and A♥ out of the shoe, the second is lowered to 1 by evaluate_aces
+    cards = game.deck.cards
+    for ace in ["A of ♠", "A of ♥"]:
+        cards.remove(next(card for card in cards if repr(card) == ace))
+    game.deck.set_cards(cards)
+    hand = game.player_hands[0]
+    hand.draw_card(make_deck(["A"]))
+    hand.draw_card(make_deck(["A"], "♥"))
+    game.funds = 1150.0
+    game.bet = 100
+    game.count = -2
+    return game
+
+
+def test_card_codes_round_trip():
+    for suit in blackjack.PlayingCard.suit_list:
+        for rank in blackjack.PlayingCard.rank_list:
+            card = blackjack.PlayingCard(rank, suit, blackjack.Deck.value[rank])
+            copy = blackjack.PlayingCard.from_code(card.to_code())
+            assert (copy.rank, copy.suit, copy.value) == (rank, suit, card.value)
+    low_ace = blackjack.PlayingCard("A", "♦", 1)
+    assert blackjack.PlayingCard.from_code(low_ace.to_code()).value == 1
+    # the low ace flag is only valid on aces, and codes cannot be negative
+    for code in [52, 128, 64, 64 + 13, -64, -1]:
+        with pytest.raises(ValueError):
+            blackjack.PlayingCard.from_code(code)
+
+
+def test_snapshot_round_trip():
+    game = mid_shoe_game()
+    snapshot = game.save_snapshot()
+    restored = blackjack.Game()
+    restored.load_snapshot(snapshot)
+
+    assert restored.save_snapshot() == snapshot
+    assert [repr(card) for card in restored.deck.cards] == [repr(card) for card in game.deck.cards]
+    assert [card.value for card in restored.player_hands[0].cards] == [11, 1]
+    assert restored.player_hands[0].score == game.player_hands[0].score == 12
+    assert restored.dealer.score == game.dealer.score
+    assert restored.funds == 1150.0 and isinstance(restored.funds, float)
+    assert restored.bet == 100 and isinstance(restored.bet, int)
+    assert restored.count == -2
+
+    # the next card dealt and the next shuffle match the saved game
+    assert repr(restored.deck.deal_card()) == repr(game.deck.deal_card())
+    game.deck.shuffle_deck()
+    restored.deck.shuffle_deck()
+    assert [repr(card) for card in restored.deck.cards] == [repr(card) for card in game.deck.cards]
+
+
+def test_deck_seed_must_fit_in_64_bits():
+    for seed in [-5, 2 ** 64]:
+        with pytest.raises(ValueError):
+            blackjack.Deck(seed=seed)
+    assert blackjack.Deck(seed=2 ** 64 - 1).seed == 2 ** 64 - 1
+
+
+def test_snapshot_leaves_random_module_alone():
+    snapshot = mid_shoe_game().save_snapshot()
+    # a new Game draws its deck seed from random, so build it first
+    game = blackjack.Game()
+    state = random.getstate()
+    game.load_snapshot(snapshot)
+    assert random.getstate() == state
+
+
+def replace_byte(data, offset, value):
+    """Overwrite one byte of a snapshot."""
+    return data[:offset] + bytes([value]) + data[offset + 1:]
+
+
+def overfull_dealer_snapshot():
+    """A snapshot whose dealer holds a sixth A♠ of a 5 deck shoe."""
+    game = blackjack.Game()
+    game.dealer.cards = [blackjack.PlayingCard("A", "♠", 11) for _ in range(6)]
+    game.deck.set_cards([card for card in game.deck.cards if repr(card) != "A of ♠"])
+    return game.save_snapshot()
+
+
+# offsets of header fields and of the first shoe card in a snapshot
+PLAYER_ACTION, SPLIT_FLAG, NUM_HANDS = 17, 18, 19
+FIRST_SHOE_CARD = blackjack.Game.snapshot_header.size + 2 * 9 + 2
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda data: data[:-1],
+    lambda data: data[:10],
+    lambda data: data + b"\x00",
+    lambda data: b"XXXX" + data[4:],
+    # type flag of the funds field
+    lambda data: data[:blackjack.Game.snapshot_header.size] + b"\x07"
+                 + data[blackjack.Game.snapshot_header.size + 1:],
+    lambda data: replace_byte(data, PLAYER_ACTION, 2),
+    lambda data: replace_byte(data, SPLIT_FLAG, 2),
+    # a split flag without a second hand or split cards
+    lambda data: replace_byte(data, SPLIT_FLAG, 1),
+    # a second hand without a split
+    lambda data: replace_byte(data, NUM_HANDS, 2),
+    # a 2 of ♠ flagged as a low ace
+    lambda data: replace_byte(data, FIRST_SHOE_CARD, 64),
+    lambda data: overfull_dealer_snapshot(),
+])
+def test_invalid_snapshot_changes_nothing(corrupt):
+    snapshot = mid_shoe_game().save_snapshot()
+    game = blackjack.Game()
+    game.funds = 7
+    before = game.save_snapshot()
+    with pytest.raises(ValueError):
+        game.load_snapshot(corrupt(snapshot))
+    assert game.funds == 7
+    assert game.save_snapshot() == before
+
+
+def brute_force_odds(cards):
+    """Enumerate every Perfect Pairs and 21+3 hand from the cards."""
+    black = ["♠", "♣"]
+    index = blackjack.Deck.rank_list.index
+    straights = [sorted(straight) for straight in blackjack.SideBets.straights]
+    pairs = {"Perfect Pair": 0, "Colored Pair": 0, "Mixed Pair": 0}
+    for a, b in itertools.permutations(cards, 2):
+        if a.rank != b.rank:
+            continue
+        if a.suit == b.suit:
+            pairs["Perfect Pair"] += 1
+        elif (a.suit in black) == (b.suit in black):
+            pairs["Colored Pair"] += 1
+        else:
+            pairs["Mixed Pair"] += 1
+    hands = dict.fromkeys(blackjack.SideBets.twenty_one_plus_three_pays, 0)
+    for a, b, c in itertools.combinations(cards, 3):
+        ranks = sorted([index(a.rank), index(b.rank), index(c.rank)])
+        flush = a.suit == b.suit == c.suit
+        straight = ranks in straights
+        if ranks[0] == ranks[2]:
+            hands["Suited Trips" if flush else "Three of a Kind"] += 1
+        elif straight and flush:
+            hands["Straight Flush"] += 1
+        elif straight:
+            hands["Straight"] += 1
+        elif flush:
+            hands["Flush"] += 1
+    n = len(cards)
+    return ({outcome: count / (n * (n - 1)) for outcome, count in pairs.items()},
+            {outcome: count / (n * (n - 1) * (n - 2) // 6) for outcome, count in hands.items()})
+
+
+def test_rank_straights_match_straights():
+    for r, straights in enumerate(blackjack.SideBets.rank_straights):
+        assert straights == [k for k, straight in enumerate(blackjack.SideBets.straights)
+                             if r in straight]
+
+
+def test_side_bets_match_brute_force():
+    deck = blackjack.Deck(seed=3)
+    deck.shuffle_deck()
+    # deal down to a small uneven shoe through the incremental updates
+    while len(deck.cards) > 70:
+        deck.deal_card()
+    pairs, hands = brute_force_odds(deck.cards)
+    quote = deck.odds.perfect_pairs()
+    for outcome in pairs:
+        assert quote[outcome] == pytest.approx(pairs[outcome], abs=1e-12)
+    quote = deck.odds.twenty_one_plus_three()
+    for outcome in hands:
+        assert quote[outcome] == pytest.approx(hands[outcome], abs=1e-12)
+    fresh = blackjack.SideBets(deck.cards)
+    assert deck.odds.totals == fresh.totals
+
+
+def test_side_bets_add_and_remove():
+    deck = blackjack.Deck(seed=4)
+    odds = deck.odds
+    card = deck.cards[0]
+    # a full shoe already holds every copy
+    with pytest.raises(ValueError):
+        odds.add_card(card)
+    odds.remove_card(card)
+    odds.add_card(card)
+    assert odds.totals == blackjack.SideBets(deck.cards).totals
+    assert odds.insurance()["Dealer Blackjack"] == pytest.approx(4 / 13)
+    for _ in range(5):
+        odds.remove_card(card)
+    with pytest.raises(ValueError):
+        odds.remove_card(card)
+
+
+def test_snapshot_rejects_overfull_shoe():
+    game = blackjack.Game()
+    # append directly, set_cards would refuse the sixth A♠
+    game.deck.cards.append(blackjack.PlayingCard("A", "♠", 11))
+    snapshot = game.save_snapshot()
+    with pytest.raises(ValueError):
+        blackjack.Game().load_snapshot(snapshot)
+
+
+def test_set_cards_keeps_odds_in_sync():
+    deck = blackjack.Deck(seed=5)
+    deck.set_cards(deck.cards[:3])
+    assert deck.odds.total == 3
+    deck.deal_card()
+    assert deck.odds.totals == blackjack.SideBets(deck.cards).totals
+    with pytest.raises(ValueError):
+        deck.set_cards([blackjack.PlayingCard("2", "♠", 2)] * 6)
+    assert len(deck.cards) == 2
+
+
+def test_deal_card_keeps_card_when_odds_fail():
+    deck = blackjack.Deck(seed=6)
+    card = deck.cards[0]
+    # drift the odds so they no longer hold the top card
+    for _ in range(5):
+        deck.odds.remove_card(card)
+    with pytest.raises(ValueError):
+        deck.deal_card()
+    assert deck.cards[0] is card and len(deck.cards) == 260
+
+
+def test_insurance_counts_unseen_tens():
+    odds = blackjack.SideBets([blackjack.PlayingCard("2", "♠", 2)])
+    hole_cards = [blackjack.PlayingCard(rank, "♥", 10) for rank in ["10", "J", "Q", "K"]]
+    assert odds.insurance(hole_cards)["Dealer Blackjack"] == pytest.approx(4 / 5)
+    ace = blackjack.PlayingCard("A", "♥", 11)
+    assert odds.insurance([ace])["Dealer Blackjack"] == 0